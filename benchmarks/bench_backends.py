@@ -0,0 +1,170 @@
+"""
+Synthetic benchmark of JSON/event loop backends.
+
+Feeds 10k controls (1000 devices x 10 controls) through the connectors:
+  * meta    - meta topics for all controls (type, readonly)
+  * config  - discovery config for all controls (JSON encoding + task scheduling + sending)
+  * state   - 10 state messages for every control (100k messages)
+
+HomeAssistantConnector publishes to a minimal MQTT endpoint over local TCP, so the event loop transport is exercised.
+The endpoint drains the socket in its own thread, so it doesn't load the measured event loop.
+Config and state times include waiting until the transport write buffer is empty.
+
+Usage: python benchmarks/bench_backends.py
+"""
+import asyncio
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from wb_hass_gw.backends import JsonBackend, EventLoopBackend, use_json_backend, use_event_loop_backend  # noqa: E402
+from wb_hass_gw.homeassistant import HomeAssistantConnector  # noqa: E402
+from wb_hass_gw.wirenboard import WirenConnector  # noqa: E402
+from wb_hass_gw.wirenboard_registry import WirenBoardDeviceRegistry  # noqa: E402
+
+DEVICES = 1000
+CONTROLS_PER_DEVICE = 10
+STATES_PER_CONTROL = 10
+CONTROL_TYPES = ('temperature', 'switch', 'value', 'power', 'voltage')
+PORT = 18832
+
+
+class _Endpoint(threading.Thread):
+    """
+    Answers CONNACK (MQTT v3.1.1) and drains everything else, one connection at a time
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self._server = socket.create_server(('127.0.0.1', PORT))
+
+    def run(self):
+        while True:
+            connection, _ = self._server.accept()
+            with connection:
+                if connection.recv(65536):  # CONNECT
+                    connection.sendall(b'\x20\x02\x00\x00')
+                while connection.recv(1 << 20):
+                    pass
+
+
+class _PublishCounter:
+    def __init__(self, publish=None):
+        self._publish = publish
+        self.messages = 0
+
+    def __call__(self, *args, **kwargs):
+        self.messages += 1
+        if self._publish:
+            self._publish(*args, **kwargs)
+
+
+async def _drain(connector):
+    transport = connector._client._connection._transport
+    while transport.get_write_buffer_size():
+        await asyncio.sleep(0.001)
+
+
+async def _run():
+    WirenBoardDeviceRegistry._devices.clear()
+
+    wiren = WirenConnector('localhost', 1883, None, None, 'bench', '',
+                           rate_limit_max_rate=0,
+                           rate_limit_quarantine_interval=1.0,
+                           rate_limit_release_after=10.0)
+    hass = HomeAssistantConnector('127.0.0.1', PORT, None, None, 'bench',
+                                  topic_prefix='wb/',
+                                  entity_prefix='WB',
+                                  discovery_topic='homeassistant',
+                                  status_topic='hass/status',
+                                  status_payload_online='online',
+                                  status_payload_offline='offline',
+                                  debounce={},
+                                  subscribe_qos=0,
+                                  availability_qos=0,
+                                  availability_retain=True,
+                                  availability_publish_delay=0,
+                                  state_qos=0,
+                                  state_retain=True,
+                                  config_qos=0,
+                                  config_retain=False,
+                                  config_publish_delay=0,
+                                  inverse=[],
+                                  split_devices=[],
+                                  split_entities=[],
+                                  ignore_availability=False,
+                                  transforms={},
+                                  mqtt_v5=False,
+                                  batch_publish=False)
+    wiren.hass = hass
+    hass.wiren = wiren
+    hass_publish = hass._publish = _PublishCounter(hass._publish)
+    wiren._publish = _PublishCounter()
+    hass._on_connect = lambda client: None
+    await hass.connect()
+
+    controls = [(f'wb-device_{d}', f'Control {c}', CONTROL_TYPES[c % len(CONTROL_TYPES)])
+                for d in range(DEVICES) for c in range(CONTROLS_PER_DEVICE)]
+    results = {}
+
+    start = time.perf_counter()
+    for d in range(DEVICES):
+        wiren._on_message(None, f'/devices/wb-device_{d}/meta/name', f'Device {d}'.encode(), 0, {})
+    for device_id, control_id, control_type in controls:
+        wiren._on_message(None, f'/devices/{device_id}/controls/{control_id}/meta/type', control_type.encode(), 0, {})
+        wiren._on_message(None, f'/devices/{device_id}/controls/{control_id}/meta/readonly', b'1', 0, {})
+    results['meta'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*hass._async_tasks.values())
+    await _drain(hass)
+    results['config'] = time.perf_counter() - start
+
+    hass_publish.messages = hass_publish.bytes = 0
+    start = time.perf_counter()
+    for i in range(STATES_PER_CONTROL):
+        payload = str(20 + i / 10).encode()
+        for device_id, control_id, _ in controls:
+            wiren._on_message(None, f'/devices/{device_id}/controls/{control_id}', payload, 0, {})
+        await _drain(hass)
+    results['state'] = time.perf_counter() - start
+    results['state_messages'] = hass_publish.messages
+
+    await hass.disconnect()
+    wiren._client._resend_task.cancel()
+    return results
+
+
+def main():
+    logging.basicConfig(level=logging.CRITICAL)
+    print(f'{DEVICES * CONTROLS_PER_DEVICE} controls, python {sys.version.split()[0]}')
+    _Endpoint().start()
+    print(f"{'json':<8} {'loop':<8} {'meta, s':>8} {'config, s':>10} {'state, s':>9} {'state msg/s':>12}")
+    for json_backend in (JsonBackend.STDLIB, JsonBackend.ORJSON):
+        for loop_backend in (EventLoopBackend.ASYNCIO, EventLoopBackend.UVLOOP):
+            if use_json_backend(json_backend) != json_backend:
+                continue
+            if use_event_loop_backend(loop_backend) != loop_backend:
+                continue
+            best = None
+            for _ in range(5):
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+                results = loop.run_until_complete(_run())
+                for task in asyncio.all_tasks(loop):
+                    task.cancel()
+                loop.run_until_complete(asyncio.sleep(0.1))
+                loop.close()
+                if best is None or results['state'] + results['config'] < best['state'] + best['config']:
+                    best = results
+            print(f"{json_backend.value:<8} {loop_backend.value:<8} {best['meta']:>8.3f} {best['config']:>10.3f} "
+                  f"{best['state']:>9.3f} {best['state_messages'] / best['state']:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Bytes on the wire: MQTT v3.1.1 vs MQTT v5 with topic aliases, with and without batched publishing.
+
+Publishes 10 states for each of 10k controls from HomeAssistantConnector to a minimal local MQTT endpoint,
+which answers CONNACK (with topic_alias_maximum for v5) and counts received bytes and socket reads.
+WirenConnector (always MQTT v3.1.1) is connected to its own endpoint at the same time, like in the gateway,
+and the protocol version of both CONNECT packets is checked.
+
+Broker CPU is not measured here, run the gateway against a real broker for that.
+
+Usage: python benchmarks/bench_mqtt_v5.py
+"""
+import asyncio
+import logging
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from wb_hass_gw.homeassistant import HomeAssistantConnector  # noqa: E402
+from wb_hass_gw.wirenboard import WirenConnector  # noqa: E402
+from wb_hass_gw.wirenboard_registry import WirenBoardDeviceRegistry  # noqa: E402
+
+DEVICES = 1000
+CONTROLS_PER_DEVICE = 10
+STATES_PER_CONTROL = 10
+PORT = 18830
+
+
+class _Endpoint:
+    def __init__(self, topic_alias_maximum):
+        self._topic_alias_maximum = topic_alias_maximum
+        self.protocol_level = None
+        self.bytes = 0
+        self.reads = 0
+
+    async def handle(self, reader, writer):
+        header = await reader.readexactly(1)
+        length, multiplier = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7f) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        connect = await reader.readexactly(length)
+        protocol_level = self.protocol_level = connect[6]
+        if protocol_level == 5:
+            properties = b'\x22' + struct.pack('!H', self._topic_alias_maximum)
+            writer.write(bytes([0x20, 3 + len(properties), 0, 0, len(properties)]) + properties)
+        else:
+            writer.write(b'\x20\x02\x00\x00')
+
+        self.bytes = self.reads = 0
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            self.bytes += len(data)
+            self.reads += 1
+
+
+async def _run(mqtt_v5, topic_alias_maximum, batch_publish):
+    WirenBoardDeviceRegistry._devices.clear()
+
+    endpoint = _Endpoint(topic_alias_maximum)
+    server = await asyncio.start_server(endpoint.handle, '127.0.0.1', PORT)
+    wiren_endpoint = _Endpoint(topic_alias_maximum)
+    wiren_server = await asyncio.start_server(wiren_endpoint.handle, '127.0.0.1', PORT + 1)
+
+    wiren = WirenConnector('127.0.0.1', PORT + 1, None, None, 'bench-wiren', '',
+                           rate_limit_max_rate=0,
+                           rate_limit_quarantine_interval=1.0,
+                           rate_limit_release_after=10.0)
+
+    hass = HomeAssistantConnector('127.0.0.1', PORT, None, None, 'bench',
+                                  topic_prefix='wb/',
+                                  entity_prefix='WB',
+                                  discovery_topic='homeassistant',
+                                  status_topic='hass/status',
+                                  status_payload_online='online',
+                                  status_payload_offline='offline',
+                                  debounce={},
+                                  subscribe_qos=0,
+                                  availability_qos=0,
+                                  availability_retain=True,
+                                  availability_publish_delay=0,
+                                  state_qos=0,
+                                  state_retain=True,
+                                  config_qos=0,
+                                  config_retain=False,
+                                  config_publish_delay=0,
+                                  inverse=[],
+                                  split_devices=[],
+                                  split_entities=[],
+                                  ignore_availability=False,
+                                  transforms={},
+                                  mqtt_v5=mqtt_v5,
+                                  batch_publish=batch_publish)
+    hass._on_connect = lambda client: None
+    # Concurrently, as in the gateway
+    await asyncio.gather(hass.connect(), wiren.connect())
+    await asyncio.sleep(0.1)
+    if endpoint.protocol_level != (5 if mqtt_v5 else 4) or wiren_endpoint.protocol_level != 4:
+        raise RuntimeError(f'Unexpected protocol level: {endpoint.protocol_level} (HA), {wiren_endpoint.protocol_level} (WB)')
+
+    registry = WirenBoardDeviceRegistry()
+    controls = [(registry.get_device(f'wb-device_{d}'), f'Control {c}')
+                for d in range(DEVICES) for c in range(CONTROLS_PER_DEVICE)]
+    controls = [(device, device.get_control(control_id)) for device, control_id in controls]
+
+    start = time.perf_counter()
+    for i in range(STATES_PER_CONTROL):
+        payload = str(20 + i / 10).encode()
+        for device, control in controls:
+            control.apply_state(payload)
+            hass.publish_state(device, control)
+        # Let the batch go out, like separate loop iterations in the gateway
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+
+    await asyncio.sleep(0.5)
+    await hass.disconnect()
+    await wiren.disconnect()
+    for s in (server, wiren_server):
+        s.close()
+        await s.wait_closed()
+    return elapsed, endpoint.bytes, endpoint.reads
+
+
+def main():
+    logging.basicConfig(level=logging.CRITICAL)
+    messages = DEVICES * CONTROLS_PER_DEVICE * STATES_PER_CONTROL
+    print(f'{messages} state messages, python {sys.version.split()[0]}')
+    print(f"{'protocol':<10} {'aliases':>8} {'batch':>6} {'bytes':>10} {'bytes/msg':>10} {'reads':>8} {'publish, s':>11}")
+    for mqtt_v5, topic_alias_maximum in ((False, 0), (True, 10), (True, 65535)):
+        for batch_publish in (False, True):
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            elapsed, received, reads = loop.run_until_complete(_run(mqtt_v5, topic_alias_maximum, batch_publish))
+            for task in asyncio.all_tasks(loop):
+                task.cancel()
+            loop.run_until_complete(asyncio.sleep(0.1))
+            loop.close()
+            print(f"{'5' if mqtt_v5 else '3.1.1':<10} {topic_alias_maximum:>8} {str(batch_publish):>6} {received:>10} "
+                  f"{received / messages:>10.1f} {reads:>8} {elapsed:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,7 @@
+import time
+
+START_TIME = time.perf_counter()  # Before other imports to include import time into the startup timeline
+
 import asyncio
 import getopt
 import logging
@@ -7,19 +11,25 @@ from enum import Enum
 from sys import argv
 
 import yaml
-from voluptuous import Required, Schema, MultipleInvalid, All, Any, Optional, Coerce
+from voluptuous import Required, Schema, MultipleInvalid, All, Any, Optional, Coerce, Invalid
 
+from wb_hass_gw.backends import JsonBackend, EventLoopBackend, use_json_backend, use_event_loop_backend
 from wb_hass_gw.homeassistant import HomeAssistantConnector
+from wb_hass_gw.slow_callback import SlowCallbackTimer
+from wb_hass_gw.startup import StartupTimeline, PHASE_IMPORTS, PHASE_CONFIG, PHASE_HASS_CONNECTED, PHASE_WIREN_CONNECTED
+from wb_hass_gw.transforms import ValueTransform
 from wb_hass_gw.wirenboard import WirenConnector
 
-logging.getLogger().setLevel(logging.INFO)  # root
+# Optional features (api, sinks, lag monitor, profiler) are imported or created only when they are enabled
 
-logger = logging.getLogger(__name__)
+StartupTimeline().start(START_TIME)
+StartupTimeline().mark(PHASE_IMPORTS)
 
-STOP = asyncio.Event()
+logging.getLogger().setLevel(logging.INFO)  # root
 
+logger = logging.getLogger(__name__)
 
-# asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+STOP = None  # asyncio.Event, created after the event loop policy is installed
 
 
 class ConfigLogLevel(Enum):
@@ -38,9 +48,39 @@ LOGLEVEL_MAPPER = {
     ConfigLogLevel.DEBUG: logging.DEBUG,
 }
 
+
+def validate_api(conf):
+    if 'unix_socket' not in conf and 'port' not in conf:
+        raise Invalid('api requires unix_socket or port')
+    return conf
+
+
+def validate_transforms(conf):
+    # Transform invert on top of `inverse` would invert the state twice
+    inverted_twice = sorted(entity_id for entity_id, transform_conf in conf['transforms'].items()
+                            if transform_conf['invert'] and entity_id in conf['inverse'])
+    if inverted_twice:
+        raise Invalid(f'entities are both in inverse and in transforms with invert: {", ".join(inverted_twice)}',
+                      path=['transforms'])
+    return conf
+
+
 config_schema = Schema({
     Optional('general', default={}): {
         Optional('loglevel', default=ConfigLogLevel.INFO): Coerce(ConfigLogLevel),
+        Optional('json_backend', default=JsonBackend.AUTO): Coerce(JsonBackend),
+        Optional('event_loop', default=EventLoopBackend.AUTO): Coerce(EventLoopBackend),
+        Optional('watchdog', default={}): {
+            Optional('enabled', default=True): bool,
+            Optional('interval', default=1.0): float,
+            Optional('lag_threshold', default=0.1): float,
+            Optional('slow_callback', default=0.05): float,
+        },
+        Optional('profiler', default={}): {
+            Optional('duration', default=30.0): float,
+            Optional('interval', default=0.005): float,
+            Optional('output_dir', default='/tmp'): str,
+        },
     },
     Required('wirenboard'): {
         Required('broker_host'): str,
@@ -48,9 +88,14 @@ config_schema = Schema({
         Optional('username'): str,
         Optional('password'): str,
         Optional('client_id', default='wb-hass-gw'): str,
-        Optional('topic_prefix', default=''): str
+        Optional('topic_prefix', default=''): str,
+        Optional('rate_limit', default={}): {
+            Optional('max_rate', default=50): int,
+            Optional('quarantine_interval', default=1.0): float,
+            Optional('release_after', default=10.0): float,
+        }
     },
-    Required('homeassistant'): {
+    Required('homeassistant'): All({
         Required('broker_host'): str,
         Optional('broker_port', default=1883): int,
         Optional('username'): str,
@@ -83,7 +128,35 @@ config_schema = Schema({
         Optional('inverse', default=[]): [str],
         Optional('split_devices', default=[]): [str],
         Optional('split_entities', default=[]): [str],
-        Optional('ignore_availability', default=False): bool
+        Optional('ignore_availability', default=False): bool,
+        Optional('transforms', default={}): {
+            str: {
+                Optional('scale'): Coerce(float),
+                Optional('offset'): Coerce(float),
+                Optional('min'): Coerce(float),
+                Optional('max'): Coerce(float),
+                Optional('round'): int,
+                Optional('invert', default=False): bool,
+                Optional('units'): str,
+            }
+        },
+        Optional('mqtt_v5', default=False): bool,
+        Optional('batch_publish', default=False): bool
+    }, validate_transforms),
+    Optional('api'): All({
+        Optional('unix_socket'): str,
+        Optional('host', default='127.0.0.1'): str,
+        Optional('port'): int,
+    }, validate_api),
+    Optional('sinks', default={}): {
+        Optional('file'): {
+            Required('path'): str,
+            Optional('measurement', default='wirenboard'): str,
+            Optional('batch_size', default=1000): int,
+            Optional('flush_interval', default=5.0): float,
+            Optional('max_file_size', default=10 * 1024 * 1024): int,
+            Optional('max_files', default=5): int,
+        },
     },
 })
 
@@ -100,14 +173,37 @@ async def main(conf):
     wiren_conf = conf['wirenboard']
     hass_conf = conf['homeassistant']
 
-    logger.info('Starting')
+    watchdog_conf = conf['general']['watchdog']
+    if watchdog_conf['enabled']:
+        SlowCallbackTimer.threshold = watchdog_conf['slow_callback']
+
+    profiler = None
+
+    def start_profiler():
+        nonlocal profiler
+        if profiler is None:
+            from wb_hass_gw.watchdog import SamplingProfiler
+            profiler_conf = conf['general']['profiler']
+            profiler = SamplingProfiler(
+                duration=profiler_conf['duration'],
+                interval=profiler_conf['interval'],
+                output_dir=profiler_conf['output_dir']
+            )
+        profiler.start()
+
+    asyncio.get_event_loop().add_signal_handler(signal.SIGUSR1, start_profiler)
+
+    logger.info(f"Starting (json: {conf['general']['json_backend'].value}, event loop: {conf['general']['event_loop'].value})")
     wiren = WirenConnector(
         broker_host=wiren_conf['broker_host'],
         broker_port=wiren_conf['broker_port'],
         username=wiren_conf['username'] if 'username' in wiren_conf else None,
         password=wiren_conf['password'] if 'password' in wiren_conf else None,
         client_id=wiren_conf['client_id'],
-        topic_prefix=wiren_conf['topic_prefix']
+        topic_prefix=wiren_conf['topic_prefix'],
+        rate_limit_max_rate=wiren_conf['rate_limit']['max_rate'],
+        rate_limit_quarantine_interval=wiren_conf['rate_limit']['quarantine_interval'],
+        rate_limit_release_after=wiren_conf['rate_limit']['release_after']
     )
     hass = HomeAssistantConnector(
         broker_host=hass_conf['broker_host'],
@@ -134,18 +230,70 @@ async def main(conf):
         inverse=hass_conf['inverse'],
         split_devices=hass_conf['split_devices'],
         split_entities=hass_conf['split_entities'],
-        ignore_availability=hass_conf['ignore_availability']
+        ignore_availability=hass_conf['ignore_availability'],
+        transforms={entity_id: ValueTransform(**transform_conf) for entity_id, transform_conf in hass_conf['transforms'].items()},
+        mqtt_v5=hass_conf['mqtt_v5'],
+        batch_publish=hass_conf['batch_publish']
     )
     wiren.hass = hass
     hass.wiren = wiren
 
-    await hass.connect()  # FIXME: handle connect exceptions
-    await wiren.connect()  # FIXME: handle connect exceptions
+    sinks = []
+    if 'file' in conf['sinks']:
+        from wb_hass_gw.sinks import LineProtocolFileSink
+        file_conf = conf['sinks']['file']
+        sinks.append(LineProtocolFileSink(
+            path=file_conf['path'],
+            measurement=file_conf['measurement'],
+            batch_size=file_conf['batch_size'],
+            flush_interval=file_conf['flush_interval'],
+            max_file_size=file_conf['max_file_size'],
+            max_files=file_conf['max_files']
+        ))
+    wiren.sinks = sinks
+
+    api_conf = conf['api'] if 'api' in conf else None
+
+    async def connect(connector, phase):
+        await connector.connect()  # FIXME: handle connect exceptions
+        StartupTimeline().mark(phase)
+
+    # Both brokers are connected concurrently. It is safe with different MQTT versions, because each connection
+    # pins its own version (see base_connector._MQTTClient). Sinks must be ready before the first state arrives
+    await asyncio.gather(
+        connect(hass, PHASE_HASS_CONNECTED),
+        connect(wiren, PHASE_WIREN_CONNECTED),
+        *(sink.start() for sink in sinks)
+    )
+
+    # Non-essential setup is deferred until both brokers are connected
+    api = None
+    if api_conf:
+        from wb_hass_gw.api import QueryApiServer
+        api = QueryApiServer(
+            unix_socket=api_conf['unix_socket'] if 'unix_socket' in api_conf else None,
+            host=api_conf['host'],
+            port=api_conf['port'] if 'port' in api_conf else None,
+            rate_limiter=wiren.rate_limiter
+        )
+        await api.start()
+
+    lag_monitor = None
+    if watchdog_conf['enabled']:
+        from wb_hass_gw.watchdog import LoopLagMonitor
+        lag_monitor = LoopLagMonitor(interval=watchdog_conf['interval'], lag_threshold=watchdog_conf['lag_threshold'])
+        lag_monitor.start()
 
     await STOP.wait()
 
+    if api:
+        await api.stop()
     await hass.disconnect()
     await wiren.disconnect()
+    for sink in sinks:
+        await sink.stop()
+    if lag_monitor:
+        lag_monitor.stop()
 
 
 def usage():
@@ -187,8 +335,14 @@ if __name__ == '__main__':
         logger.error('Config error')
         logger.error(e)
         exit(1)
+    StartupTimeline().mark(PHASE_CONFIG)
+
+    config['general']['json_backend'] = use_json_backend(config['general']['json_backend'])
+    config['general']['event_loop'] = use_event_loop_backend(config['general']['event_loop'])
 
-    loop = asyncio.get_event_loop()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    STOP = asyncio.Event()
 
     loop.add_signal_handler(signal.SIGINT, ask_exit)
     loop.add_signal_handler(signal.SIGTERM, ask_exit)
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from wb_hass_gw import backends
+from wb_hass_gw.slow_callback import SlowCallbackTimer
+from wb_hass_gw.wirenboard_registry import WirenBoardDeviceRegistry, WirenDevice, WirenControl
+
+logger = logging.getLogger(__name__)
+
+
+def control_to_dict(device: WirenDevice, control: WirenControl):
+    return {
+        'device': device.id,
+        'id': control.id,
+        'type': control.type.value if control.type else None,
+        'units': control.units,
+        'read_only': control.read_only,
+        'error': control.error,
+        'max': control.max,
+        'state': control.state,
+        'last_update': control.last_update,
+    }
+
+
+def device_to_dict(device: WirenDevice, controls):
+    return {
+        'id': device.id,
+        'name': device.name,
+        'controls': [control_to_dict(device, control) for control in controls],
+    }
+
+
+class _Filter:
+    """
+    Query string filter. All values can be comma separated lists:
+    device=<id>, control=<id>, type=<wirenboard type>, error=0|1, since=<unix timestamp>
+    """
+
+    def __init__(self, query):
+        params = parse_qs(query)
+        self._devices = self._set(params, 'device')
+        self._controls = self._set(params, 'control')
+        self._types = self._set(params, 'type')
+        errors = self._set(params, 'error')
+        self._errors = {value in ('1', 'true') for value in errors} if errors else None
+        self._since = float(params['since'][0]) if 'since' in params else None
+
+    @staticmethod
+    def _set(params, name):
+        if name not in params:
+            return None
+        return {value for values in params[name] for value in values.split(',')}
+
+    @property
+    def has_control_filters(self):
+        return any(f is not None for f in (self._controls, self._types, self._errors, self._since))
+
+    def match_device(self, device: WirenDevice):
+        return self._devices is None or device.id in self._devices
+
+    def match_control(self, control: WirenControl):
+        if self._controls is not None and control.id not in self._controls:
+            return False
+        if self._types is not None and (control.type is None or control.type.value not in self._types):
+            return False
+        if self._errors is not None and bool(control.error) not in self._errors:
+            return False
+        if self._since is not None and (control.last_update is None or control.last_update < self._since):
+            return False
+        return True
+
+    def match(self, device: WirenDevice, control: WirenControl):
+        return self.match_device(device) and self.match_control(control)
+
+
+class _HttpError(Exception):
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+class QueryApiServer:
+    """
+    Read-only HTTP/1.1 endpoint over the in-memory WirenBoardDeviceRegistry.
+    Serves snapshots directly from memory without touching MQTT.
+
+    GET /devices                                 - all devices with controls
+    GET /devices/<device_id>                     - single device
+    GET /devices/<device_id>/controls/<control>  - single control
+    GET /changes                                 - change feed, one JSON object per line (NDJSON)
+    GET /quarantine                              - rate limiter state and quarantined controls
+    """
+
+    _feed_queue_size = 1000
+
+    def __init__(self, unix_socket=None, host=None, port=None, rate_limiter=None):
+        self._unix_socket = unix_socket
+        self._rate_limiter = rate_limiter
+        self._host = host
+        self._port = port
+        self._server = None
+
+    async def start(self):
+        if self._unix_socket:
+            if os.path.exists(self._unix_socket):
+                os.unlink(self._unix_socket)
+            self._server = await asyncio.start_unix_server(self._handle_client, path=self._unix_socket)
+            logger.info(f'Query API is listening on {self._unix_socket}')
+        else:
+            self._server = await asyncio.start_server(self._handle_client, host=self._host, port=self._port)
+            logger.info(f'Query API is listening on {self._host}:{self._port}')
+
+    async def stop(self):
+        if not self._server:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        if self._unix_socket and os.path.exists(self._unix_socket):
+            os.unlink(self._unix_socket)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            # Headers are not used, just skip them
+            while True:
+                line = await reader.readline()
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+
+            try:
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            except ValueError:
+                raise _HttpError(400, 'Bad Request')
+            if method != 'GET':
+                raise _HttpError(405, 'Method Not Allowed')
+
+            url = urlsplit(target)
+            path = [unquote(part) for part in url.path.strip('/').split('/')]
+            try:
+                query_filter = _Filter(url.query)
+            except ValueError:
+                raise _HttpError(400, 'Bad Request')
+
+            if path == ['changes']:
+                await self._stream_changes(reader, writer, query_filter)
+            else:
+                with SlowCallbackTimer(f'QueryApiServer.get({url.path})'):
+                    if path == ['quarantine'] and self._rate_limiter is not None:
+                        body = self._rate_limiter.stats
+                    else:
+                        body = self._get_snapshot(path, query_filter)
+                    self._write_response(writer, 200, 'OK', body)
+                await writer.drain()
+        except _HttpError as e:
+            self._write_response(writer, e.status, e.reason, {'error': e.reason})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.exception(e)
+            self._write_response(writer, 500, 'Internal Server Error', {'error': str(e)})
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _get_snapshot(path, query_filter: _Filter):
+        devices = WirenBoardDeviceRegistry().devices
+        if path == ['devices']:
+            result = []
+            for device in list(devices.values()):
+                if not query_filter.match_device(device):
+                    continue
+                controls = [control for control in device.controls.values() if query_filter.match_control(control)]
+                if controls or not query_filter.has_control_filters:
+                    result.append(device_to_dict(device, controls))
+            return result
+        if len(path) >= 2 and path[0] == 'devices':
+            device = devices.get(path[1])
+            if device is None:
+                raise _HttpError(404, 'Not Found')
+            if len(path) == 2:
+                return device_to_dict(device, list(device.controls.values()))
+            if len(path) == 4 and path[2] == 'controls':
+                control = device.controls.get(path[3])
+                if control is None:
+                    raise _HttpError(404, 'Not Found')
+                return control_to_dict(device, control)
+        raise _HttpError(404, 'Not Found')
+
+    async def _stream_changes(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, query_filter: _Filter):
+        queue = asyncio.Queue(maxsize=self._feed_queue_size)
+        dropped = 0
+
+        def on_change(device, control):
+            nonlocal dropped
+            if not query_filter.match(device, control):
+                return
+            try:
+                queue.put_nowait(control_to_dict(device, control))
+            except asyncio.QueueFull:
+                if not dropped:
+                    logger.warning('Query API change feed client is too slow, dropping changes')
+                dropped += 1
+
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: application/x-ndjson\r\n'
+                     b'Cache-Control: no-cache\r\n'
+                     b'Connection: close\r\n\r\n')
+        WirenBoardDeviceRegistry().add_listener(on_change)
+        # Client is not expected to send anything else, so EOF means that it has gone
+        client_gone = asyncio.ensure_future(reader.read())
+        try:
+            while True:
+                next_change = asyncio.ensure_future(queue.get())
+                await asyncio.wait((next_change, client_gone), return_when=asyncio.FIRST_COMPLETED)
+                if client_gone.done():
+                    next_change.cancel()
+                    break
+                writer.write(backends.json_dumps(next_change.result()) + b'\n')
+                await writer.drain()
+        finally:
+            client_gone.cancel()
+            WirenBoardDeviceRegistry().remove_listener(on_change)
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status, reason, body):
+        data = backends.json_dumps(body)
+        writer.write(f'HTTP/1.1 {status} {reason}\r\n'
+                     f'Content-Type: application/json\r\n'
+                     f'Content-Length: {len(data)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode('latin-1') + data)
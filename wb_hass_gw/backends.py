@@ -0,0 +1,70 @@
+"""
+Optional faster backends with clean fallback to the standard library:
+
+* JSON encoding: orjson -> stdlib json
+* Event loop: uvloop -> asyncio
+"""
+import asyncio
+import json
+import logging
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+
+class JsonBackend(Enum):
+    AUTO = 'auto'
+    ORJSON = 'orjson'
+    STDLIB = 'stdlib'
+
+
+class EventLoopBackend(Enum):
+    AUTO = 'auto'
+    UVLOOP = 'uvloop'
+    ASYNCIO = 'asyncio'
+
+
+def _stdlib_json_dumps(obj) -> bytes:
+    return json.dumps(obj).encode('utf-8')
+
+
+# Encode object to JSON bytes, can be replaced with use_json_backend()
+json_dumps = _stdlib_json_dumps
+
+
+def use_json_backend(backend: JsonBackend) -> JsonBackend:
+    """
+    Select JSON encoder for json_dumps(). Returns backend which is actually used
+    """
+    global json_dumps
+
+    if backend in (JsonBackend.AUTO, JsonBackend.ORJSON):
+        try:
+            import orjson
+        except ImportError:
+            if backend == JsonBackend.ORJSON:
+                logger.warning('orjson is not installed, falling back to stdlib json')
+        else:
+            json_dumps = orjson.dumps
+            return JsonBackend.ORJSON
+
+    json_dumps = _stdlib_json_dumps
+    return JsonBackend.STDLIB
+
+
+def use_event_loop_backend(backend: EventLoopBackend) -> EventLoopBackend:
+    """
+    Install event loop policy. Must be called before the event loop is created. Returns backend which is actually used
+    """
+    if backend in (EventLoopBackend.AUTO, EventLoopBackend.UVLOOP):
+        try:
+            import uvloop
+        except ImportError:
+            if backend == EventLoopBackend.UVLOOP:
+                logger.warning('uvloop is not installed, falling back to asyncio event loop')
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return EventLoopBackend.UVLOOP
+
+    asyncio.set_event_loop_policy(None)
+    return EventLoopBackend.ASYNCIO
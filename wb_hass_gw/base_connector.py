@@ -1,45 +1,103 @@
+import asyncio
 import logging
+import time
 from abc import ABC, abstractmethod
 
-from gmqtt import Client as MQTTClient
-from gmqtt.mqtt.constants import MQTTv311
+from gmqtt import Client as MQTTClient, Message
+from gmqtt.mqtt.constants import MQTTv311, MQTTv50
+from gmqtt.mqtt.package import PublishPacket
+
+from wb_hass_gw.slow_callback import SlowCallbackTimer
 
 logger = logging.getLogger(__name__)
 
 
-class BaseConnector(ABC):
+class _MQTTClient(MQTTClient):
+    """
+    gmqtt keeps the protocol version in the MQTTProtocol class attribute, so every connect() overwrites it
+    for all clients in the process. The version is pinned on the protocol instance of each connection instead,
+    before CONNECT is sent
+    """
+
+    def __init__(self, client_id, protocol_version):
+        super().__init__(client_id)
+        self._protocol_version = protocol_version
+
+    async def _create_connection(self, host, port, ssl, clean_session, keepalive):
+        connection = await super()._create_connection(host, port, ssl, clean_session, keepalive)
+        connection._protocol.proto_ver = self._protocol_version
+        return connection
+
+    def _handle_connack_packet(self, cmd, packet):
+        if packet[1] == 1 and self._protocol_version == MQTTv50:
+            # Unacceptable protocol version, gmqtt reconnects with MQTT v3.1.1
+            self._protocol_version = MQTTv311
+        return super()._handle_connack_packet(cmd, packet)
 
-    def __init__(self, broker_host, broker_port, username, password, client_id):
+
+class BaseConnector(ABC):
+    def __init__(self, broker_host, broker_port, username, password, client_id, mqtt_v5=False, batch_publish=False):
         self._broker_host = broker_host
         self._broker_port = broker_port
         self._username = username
         self._password = password
         self._client_id = client_id
+        self._protocol_version = MQTTv50 if mqtt_v5 else MQTTv311
+        self._batch_publish = batch_publish
 
-        self._client = MQTTClient(self._client_id)
+        self._publish_batch = []
+        self._topic_aliases = {}  # topic -> alias, valid for the current connection only
+        self._topic_alias_maximum = 0
+        self._topic_publish_counts = {}
+        self._not_ready_logged = False
+
+        self._client = _MQTTClient(self._client_id, self._protocol_version)
         self._client.on_connect = self.__on_connect
-        self._client.on_message = self._on_message
+        self._client.on_message = self.__on_message
         self._client.on_disconnect = self._on_disconnect
         self._client.on_subscribe = self._on_subscribe
 
     async def connect(self):
         if self._username and self._password:
             self._client.set_auth_credentials(self._username, self._password)
-        await self._client.connect(self._broker_host, port=self._broker_port, version=MQTTv311)
+        await self._client.connect(self._broker_host, port=self._broker_port, version=self._protocol_version)
 
     def disconnect(self):
         return self._client.disconnect()
 
     def __on_connect(self, client, flags, rc, properties):
-        logger.info(f'Connected to {self._broker_host}')
+        logger.info(f'Connected to {self._broker_host} (MQTT {"5" if client.protocol_version == MQTTv50 else "3.1.1"})')
+        self._not_ready_logged = False
+        # Queued messages may carry topic aliases of the previous connection
+        self._publish_batch = []
+        self._topic_aliases = {}
+        self._topic_publish_counts = {}
+        self._topic_alias_maximum = 0
+        if client.protocol_version == MQTTv50:
+            # gmqtt passes CONNECT properties to the callback, broker limits are in CONNACK
+            connack_properties = getattr(client, '_connack_properties', {})
+            self._topic_alias_maximum = connack_properties.get('topic_alias_maximum', [0])[0]
+            logger.info(f'MQTT v5, topic alias maximum: {self._topic_alias_maximum} ({self._broker_host})')
         return self._on_connect(client)
 
+    def __on_message(self, client, topic, payload, qos, properties):
+        threshold = SlowCallbackTimer.threshold
+        if threshold is None:
+            return self._on_message(client, topic, payload, qos, properties)
+        start = time.perf_counter()
+        try:
+            return self._on_message(client, topic, payload, qos, properties)
+        finally:
+            duration = time.perf_counter() - start
+            if duration > threshold:
+                logger.warning(f'Slow callback {self.__class__.__name__}._on_message({topic}): {duration * 1000:.1f} ms')
+
     @abstractmethod
     def _on_message(self, client, topic, payload, qos, properties):
         pass
 
     def _on_subscribe(self, client, mid, qos, properties):
-        logger.debug(f'Subscribed ({self._broker_host})')
+        logger.debug('Subscribed (%s)', self._broker_host)
 
     def _on_disconnect(self, packet, exc=None):
         logger.warning(f'Disconnected from {self._broker_host}')
@@ -50,7 +108,64 @@ class BaseConnector(ABC):
 
     def _publish(self, message_or_topic, payload=None, qos=0, retain=False, **kwargs):
         if not self._client.is_connected:
-            logger.warning(f"Client not ready ({self._broker_host})")
+            # Log only once, messages are dropped until connection is established
+            if not self._not_ready_logged:
+                logger.warning(f"Client not ready ({self._broker_host})")
+                self._not_ready_logged = True
+            return
+        if self._batch_publish:
+            if not self._publish_batch:
+                asyncio.get_event_loop().call_soon(self._flush_publish_batch)
+            self._publish_batch.append((message_or_topic, payload, qos, retain, kwargs))
             return
         self._client.publish(message_or_topic, payload, qos, retain, **kwargs)
 
+    def _publish_aliased(self, topic, payload=None, qos=0, retain=False):
+        """
+        Publish with MQTT v5 topic alias if the broker allows it.
+        Alias is assigned to the topic on its second publish, so one-time topics do not take aliases.
+        QoS 1/2 messages are published without alias: gmqtt resends unacknowledged packets as is after a reconnect,
+        and aliases are valid for one connection only.
+        """
+        if qos or not self._topic_alias_maximum or not self._client.is_connected:
+            return self._publish(topic, payload, qos, retain)
+
+        alias = self._topic_aliases.get(topic)
+        if alias is not None:
+            return self._publish('', payload, qos, retain, topic_alias=alias)
+
+        if len(self._topic_aliases) < self._topic_alias_maximum:
+            count = self._topic_publish_counts.get(topic, 0) + 1
+            if count >= 2:
+                del self._topic_publish_counts[topic]
+                alias = len(self._topic_aliases) + 1
+                self._topic_aliases[topic] = alias
+                # First publish with alias must contain the full topic
+                return self._publish(topic, payload, qos, retain, topic_alias=alias)
+            self._topic_publish_counts[topic] = count
+        self._publish(topic, payload, qos, retain)
+
+    def _flush_publish_batch(self):
+        """
+        Build PUBLISH packets of the whole batch and write them to the transport at once
+        """
+        batch, self._publish_batch = self._publish_batch, []
+        if not batch:
+            return
+        if not self._client.is_connected:
+            logger.warning(f"Client not ready, {len(batch)} messages dropped ({self._broker_host})")
+            return
+
+        protocol = self._client._connection._protocol
+        packets = []
+        for message_or_topic, payload, qos, retain, kwargs in batch:
+            if isinstance(message_or_topic, Message):
+                message = message_or_topic
+            else:
+                message = Message(message_or_topic, payload, qos=qos, retain=retain, **kwargs)
+            mid, packet = PublishPacket.build_package(message, protocol)
+            if message.qos > 0:
+                self._client._persistent_storage.push_message_nowait(mid, packet)
+            packets.append(packet)
+        protocol.write_data(b''.join(packets))
+
@@ -1,11 +1,13 @@
 import asyncio
-import json
 import logging
 import re
 import time
 
+from wb_hass_gw import backends
 from wb_hass_gw.base_connector import BaseConnector
 from wb_hass_gw.mappers import apply_payload_for_component
+from wb_hass_gw.slow_callback import SlowCallbackTimer
+from wb_hass_gw.startup import StartupTimeline, PHASE_FIRST_DISCOVERY, PHASE_ALL_ENTITIES
 from wb_hass_gw.wirenboard_registry import WirenControl, WirenDevice, WirenBoardDeviceRegistry
 
 logger = logging.getLogger(__name__)
@@ -34,9 +36,12 @@ class HomeAssistantConnector(BaseConnector):
                  inverse,
                  split_devices,
                  split_entities,
-                 ignore_availability
+                 ignore_availability,
+                 transforms,
+                 mqtt_v5,
+                 batch_publish
                  ):
-        super().__init__(broker_host, broker_port, username, password, client_id)
+        super().__init__(broker_host, broker_port, username, password, client_id, mqtt_v5=mqtt_v5, batch_publish=batch_publish)
 
         self._topic_prefix = topic_prefix
         self._entity_prefix = entity_prefix
@@ -58,11 +63,13 @@ class HomeAssistantConnector(BaseConnector):
         self._split_devices = split_devices
         self._split_entities = split_entities
         self._ignore_availability = ignore_availability
+        self._transforms = transforms  # Entity unique ID -> ValueTransform
 
         self._control_set_topic_re = re.compile(self._topic_prefix + r"devices/([^/]*)/controls/([^/]*)/on$")
         self._component_types = {}
         self._debounce_last_published = {}
         self._async_tasks = {}
+        self._pending_configs = set()
 
     def _on_connect(self, client):
         client.subscribe(self._status_topic, qos=self._subscribe_qos)
@@ -71,8 +78,8 @@ class HomeAssistantConnector(BaseConnector):
 
     def _on_message(self, client, topic, payload, qos, properties):
         # print(f'RECV MSG: {topic}', payload)
-        payload = payload.decode("utf-8")
         if topic == self._status_topic:
+            payload = payload.decode("utf-8")
             if payload == self._status_payload_online:
                 logger.info('Home assistant changed status to online. Pushing all devices')
                 self._publish_all_controls()
@@ -85,6 +92,9 @@ class HomeAssistantConnector(BaseConnector):
             if control_set_state_topic_match:
                 device = WirenBoardDeviceRegistry().get_device(control_set_state_topic_match.group(1))
                 control = device.get_control(control_set_state_topic_match.group(2))
+                if control.transform:
+                    payload = control.transform.command(payload)
+                # Forward command payload to the Wiren Board as is, without decoding
                 self.wiren.set_control_state(device, control, payload)
 
     def _publish_all_controls(self):
@@ -98,6 +108,14 @@ class HomeAssistantConnector(BaseConnector):
     def _get_availability_topic(self, device: WirenDevice, control: WirenControl):
         return f"{self._get_control_topic(device, control)}/availability"
 
+    def _get_entity_id_prefix(self):
+        if self._entity_prefix:
+            return self._entity_prefix.lower().replace(" ", "_").replace("-", "_") + '_'
+        return ''
+
+    def _get_entity_unique_id(self, device: WirenDevice, control: WirenControl):
+        return f"{self._get_entity_id_prefix()}{device.id}_{control.id}".lower().replace(" ", "_").replace("-", "_")
+
     def _run_task(self, task_id, task):
         loop = asyncio.get_event_loop()
         if task_id in self._async_tasks:
@@ -117,8 +135,15 @@ class HomeAssistantConnector(BaseConnector):
 
     def _publish_state_sync(self, device, control):
         target_topic = f"{self._topic_prefix}devices/{device.id}/controls/{control.id}"
-        self._publish(target_topic, control.state, qos=self._state_qos, retain=self._state_retain)
-        logger.debug(f"[{device.debug_id}/{control.debug_id}] state: {control.state}")
+        payload = control.raw_state
+        if self._transforms:
+            if control.transform is None:
+                control.transform = self._transforms.get(self._get_entity_unique_id(device, control), False)
+            if control.transform and payload is not None:
+                payload = control.transform(payload)
+        self._publish_aliased(target_topic, payload, qos=self._state_qos, retain=self._state_retain)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[{device.debug_id}/{control.debug_id}] state: {control.state}")
         self._debounce_last_published[control.id] = time.time()
 
     def publish_availability(self, device: WirenDevice, control: WirenControl):
@@ -127,7 +152,8 @@ class HomeAssistantConnector(BaseConnector):
 
         async def publish_availability():
             await asyncio.sleep(self._availability_publish_delay)
-            self._publish_availability_sync(device, control)
+            with SlowCallbackTimer(f'HomeAssistantConnector.publish_availability({device.id}/{control.id})'):
+                self._publish_availability_sync(device, control)
 
         self._run_task(f"{device.id}_{control.id}_availability", publish_availability())
 
@@ -141,25 +167,31 @@ class HomeAssistantConnector(BaseConnector):
         self._publish(topic, payload, qos=self._availability_qos, retain=self._availability_retain)
 
     def publish_config(self, device: WirenDevice, control: WirenControl):
+        task_id = f"{device.id}_{control.id}_config"
+
         async def do_publish_config():
             await asyncio.sleep(self._config_publish_delay)
-            self._publish_config_sync(device, control)
+            try:
+                with SlowCallbackTimer(f'HomeAssistantConnector.publish_config({device.id}/{control.id})'):
+                    self._publish_config_sync(device, control)
 
-            # Publish availability and state every time after publishing config
-            self._publish_availability_sync(device, control)
-            self._publish_state_sync(device, control)
+                    # Publish availability and state every time after publishing config
+                    self._publish_availability_sync(device, control)
+                    self._publish_state_sync(device, control)
+            finally:
+                self._pending_configs.discard(task_id)
+                if not self._pending_configs and self._client.is_connected:
+                    StartupTimeline().mark(PHASE_ALL_ENTITIES)
 
-        self._run_task(f"{device.id}_{control.id}_config", do_publish_config())
+        self._pending_configs.add(task_id)
+        self._run_task(task_id, do_publish_config())
 
     def _publish_config_sync(self, device: WirenDevice, control: WirenControl):
         """
         Publish discovery topic to the HA
         """
 
-        if self._entity_prefix:
-            entity_id_prefix = self._entity_prefix.lower().replace(" ", "_").replace("-", "_") + '_'
-        else:
-            entity_id_prefix = ''
+        entity_id_prefix = self._get_entity_id_prefix()
 
         if WirenBoardDeviceRegistry().is_local_device(device):
             device_unique_id = entity_id_prefix + 'wirenboard'
@@ -170,7 +202,7 @@ class HomeAssistantConnector(BaseConnector):
 
         device_unique_id = device_unique_id.lower().replace(" ", "_").replace("-", "_")
 
-        entity_unique_id = f"{entity_id_prefix}{device.id}_{control.id}".lower().replace(" ", "_").replace("-", "_")
+        entity_unique_id = self._get_entity_unique_id(device, control)
         object_id = f"{control.id}".lower().replace(" ", "_").replace("-", "_")
         entity_name = f"{self._entity_prefix} {device.id} {control.id}".replace("_", " ").title()
 
@@ -204,7 +236,13 @@ class HomeAssistantConnector(BaseConnector):
         if not component:
             return
 
+        control.transform = self._transforms.get(entity_unique_id, False)
+        if control.transform and control.transform.units and component == 'sensor':
+            payload['unit_of_measurement'] = control.transform.units
+
         # Topic path: <discovery_topic>/<component>/[<node_id>/]<object_id>/config
         topic = self._discovery_prefix + '/' + component + '/' + node_id + '/' + object_id + '/config'
         logger.info(f"[{device.debug_id}/{control.debug_id}] publish config to '{topic}'")
-        self._publish(topic, json.dumps(payload), qos=self._config_qos, retain=self._config_retain)
+        self._publish(topic, backends.json_dumps(payload), qos=self._config_qos, retain=self._config_retain)
+        if self._client.is_connected:
+            StartupTimeline().mark(PHASE_FIRST_DISCOVERY)
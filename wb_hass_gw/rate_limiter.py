@@ -0,0 +1,132 @@
+import logging
+import time
+
+from wb_hass_gw.wirenboard_registry import WirenDevice, WirenControl
+
+logger = logging.getLogger(__name__)
+
+
+class _ControlRate:
+    __slots__ = ('window_start', 'window_count', 'quarantined', 'quarantined_at', 'calm_since', 'suppressed', 'pending')
+
+    def __init__(self, now):
+        self.window_start = now
+        self.window_count = 0
+        self.quarantined = False
+        self.quarantined_at = None
+        self.calm_since = None
+        self.suppressed = 0
+        self.pending = False
+
+
+class ControlRateLimiter:
+    """
+    Per-control inbound rate accounting.
+
+    Every control gets a one second counting window. When a control exceeds `max_rate` messages
+    per window it is quarantined: the caller is told to hold messages back and forward only the latest
+    value every `quarantine_interval` seconds. The control is released after it stays under `max_rate`
+    for `release_after` seconds.
+    """
+
+    _window_sec = 1.0
+
+    def __init__(self, max_rate, quarantine_interval, release_after):
+        self._max_rate = max_rate
+        self._quarantine_interval = quarantine_interval
+        self._release_after = release_after
+        self._rates = {}
+        self._quarantines_total = 0
+
+    @property
+    def enabled(self):
+        return self._max_rate > 0
+
+    @property
+    def quarantine_interval(self):
+        return self._quarantine_interval
+
+    @property
+    def stats(self):
+        return {
+            'max_rate': self._max_rate,
+            'quarantines_total': self._quarantines_total,
+            'quarantined': [
+                {
+                    'device': device_id,
+                    'control': control_id,
+                    'since': rate.quarantined_at,
+                    'suppressed': rate.suppressed,
+                }
+                for (device_id, control_id), rate in list(self._rates.items()) if rate.quarantined
+            ],
+        }
+
+    def accept(self, device: WirenDevice, control: WirenControl) -> bool:
+        """
+        Account one inbound message for the control.
+        Returns False if the message must be held back because the control is quarantined
+        """
+        now = time.monotonic()
+        key = (device.id, control.id)
+        rate = self._rates.get(key)
+        if rate is None:
+            rate = self._rates[key] = _ControlRate(now)
+
+        self._roll_window(rate, now, device, control)
+        rate.window_count += 1
+
+        if not rate.quarantined and rate.window_count > self._max_rate:
+            logger.warning(f'[{device.debug_id}/{control.debug_id}] exceeds {self._max_rate} messages/sec, quarantined. '
+                           f'Only latest value will be forwarded every {self._quarantine_interval} sec')
+            rate.quarantined = True
+            rate.quarantined_at = time.time()
+            rate.calm_since = None
+            self._quarantines_total += 1
+
+        if rate.quarantined:
+            rate.suppressed += 1
+            rate.pending = True
+            return False
+        return True
+
+    def take_pending(self, device: WirenDevice, control: WirenControl) -> bool:
+        """
+        Returns True if messages were held back since the previous call
+        """
+        rate = self._rates.get((device.id, control.id))
+        if rate is None or not rate.pending:
+            return False
+        rate.pending = False
+        return True
+
+    def check_quarantine(self, device: WirenDevice, control: WirenControl) -> bool:
+        """
+        Release the control if it has calmed down, even if it sends nothing anymore.
+        Returns True if the control is still quarantined
+        """
+        rate = self._rates.get((device.id, control.id))
+        if rate is None:
+            return False
+        self._roll_window(rate, time.monotonic(), device, control)
+        return rate.quarantined
+
+    def _roll_window(self, rate: _ControlRate, now, device: WirenDevice, control: WirenControl):
+        elapsed = now - rate.window_start
+        if elapsed < self._window_sec:
+            return
+        if rate.quarantined:
+            # Windows without any messages are calm too, so use the average over the elapsed time
+            if rate.window_count / elapsed * self._window_sec <= self._max_rate:
+                if rate.calm_since is None:
+                    rate.calm_since = rate.window_start
+                if now - rate.calm_since >= self._release_after:
+                    logger.warning(f'[{device.debug_id}/{control.debug_id}] released from quarantine, {rate.suppressed} messages suppressed')
+                    rate.quarantined = False
+                    rate.quarantined_at = None
+                    rate.calm_since = None
+                    rate.suppressed = 0
+            else:
+                rate.calm_since = None
+        rate.window_start = now
+        rate.window_count = 0
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import math
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from wb_hass_gw.slow_callback import SlowCallbackTimer
+from wb_hass_gw.wirenboard_registry import WirenDevice, WirenControl
+
+logger = logging.getLogger(__name__)
+
+
+class BaseSink(ABC):
+    """
+    Sink gets every state change which is forwarded to the Home Assistant
+    """
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    def publish_state(self, device: WirenDevice, control: WirenControl):
+        pass
+
+
+def _escape_tag(value):
+    return value.replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+
+def _escape_field_str(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+class LineProtocolFileSink(BaseSink):
+    """
+    Append-only file writer in InfluxDB line protocol:
+    <measurement>,device=<device>,control=<control>[,type=<type>] value=<state> <timestamp ns>
+
+    Numeric states are written to the float `value` field, other states to the string `value_str` field,
+    so the type of each field never changes within a series.
+
+    Lines are batched in memory and written by a single worker thread when batch_size lines are collected
+    or every flush_interval seconds. File is rotated when it exceeds max_file_size bytes,
+    max_files rotated files are kept (<path>.1 ... <path>.<max_files>)
+    """
+
+    def __init__(self, path, measurement, batch_size, flush_interval, max_file_size, max_files):
+        self._path = path
+        self._measurement = _escape_tag(measurement)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_file_size = max_file_size
+        self._max_files = max_files
+
+        self._buffer = []
+        self._file = None
+        # Single worker keeps batches in order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sink')
+        self._flush_task = None
+
+    async def start(self):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self._executor, self._open)
+        self._flush_task = loop.create_task(self._flush_periodically())
+        logger.info(f'Writing state changes to {self._path}')
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._flush()
+        await asyncio.get_event_loop().run_in_executor(self._executor, self._close)
+        self._executor.shutdown()
+
+    def publish_state(self, device: WirenDevice, control: WirenControl):
+        try:
+            value = float(control.raw_state)
+        except (TypeError, ValueError):
+            value = None
+        if value is not None and math.isfinite(value):
+            field = 'value=' + repr(value)
+        else:
+            field = 'value_str="' + _escape_field_str(control.state or '') + '"'
+
+        tags = f'{self._measurement},device={_escape_tag(device.id)},control={_escape_tag(control.id)}'
+        if control.type:
+            tags += f',type={control.type.value}'
+        self._buffer.append(f'{tags} {field} {int(control.last_update * 1e9)}\n')
+
+        if len(self._buffer) >= self._batch_size:
+            self._flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            if self._buffer:
+                with SlowCallbackTimer(f'{self.__class__.__name__}.flush'):
+                    written = self._flush()
+                await written
+
+    def _flush(self):
+        lines, self._buffer = self._buffer, []
+        return asyncio.get_event_loop().run_in_executor(self._executor, self._write, lines)
+
+    # Methods below are called in the worker thread
+
+    def _open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+        self._file = open(self._path, 'a', encoding='utf-8')
+
+    def _close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write(self, lines):
+        if not lines or not self._file:
+            return
+        try:
+            self._file.write(''.join(lines))
+            self._file.flush()
+            if self._max_file_size and self._file.tell() >= self._max_file_size:
+                self._rotate()
+        except OSError as e:
+            logger.error(f'Could not write to {self._path}: {e}')
+
+    def _rotate(self):
+        self._close()
+        for i in range(self._max_files - 1, 0, -1):
+            src = f'{self._path}.{i}'
+            if os.path.exists(src):
+                os.replace(src, f'{self._path}.{i + 1}')
+        if self._max_files > 0:
+            os.replace(self._path, f'{self._path}.1')
+        else:
+            os.remove(self._path)
+        self._open()
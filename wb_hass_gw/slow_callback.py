@@ -0,0 +1,30 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SlowCallbackTimer:
+    """
+    Context manager which logs a warning when the block runs longer than `threshold` seconds,
+    i.e. blocks the event loop. Disabled while threshold is None
+    """
+    __slots__ = ('_name', '_start')
+
+    threshold = None
+
+    def __init__(self, name):
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        if self.threshold is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._start is None:
+            return
+        duration = time.perf_counter() - self._start
+        if duration > self.threshold:
+            logger.warning(f'Slow callback {self._name}: {duration * 1000:.1f} ms')
@@ -0,0 +1,50 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+PHASE_IMPORTS = 'imports'
+PHASE_CONFIG = 'config validated'
+PHASE_HASS_CONNECTED = 'homeassistant connected'
+PHASE_WIREN_CONNECTED = 'wirenboard connected'
+PHASE_FIRST_META = 'first meta received'
+PHASE_FIRST_DISCOVERY = 'first discovery published'
+PHASE_ALL_ENTITIES = 'all entities published'
+
+
+class StartupTimeline:
+    """
+    Records time of the startup phases relative to the process start.
+    Only the first occurrence of each phase is recorded. Summary is logged when all entities are published
+    """
+    _start = time.perf_counter()
+    _marks = {}
+
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(StartupTimeline, cls).__new__(cls)
+        return cls.instance
+
+    def start(self, start_time):
+        StartupTimeline._start = start_time
+
+    @property
+    def marks(self):
+        return self._marks
+
+    def mark(self, phase):
+        if phase in self._marks:
+            return
+        elapsed = time.perf_counter() - self._start
+        self._marks[phase] = elapsed
+        logger.debug('Startup: %s +%.3f s', phase, elapsed)
+        if phase == PHASE_ALL_ENTITIES:
+            logger.info('Startup timeline:\n' + self.summary())
+
+    def summary(self):
+        lines = []
+        previous = 0.0
+        for phase, elapsed in sorted(self._marks.items(), key=lambda item: item[1]):
+            lines.append(f'  {phase:<28} {elapsed:8.3f} s (+{elapsed - previous:.3f} s)')
+            previous = elapsed
+        return '\n'.join(lines)
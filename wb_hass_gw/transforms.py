@@ -0,0 +1,75 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+_INVERTED_PAYLOADS = {b'0': b'1', b'1': b'0'}
+
+
+def _format_number(value: float) -> bytes:
+    if value.is_integer():
+        return str(int(value)).encode('ascii')
+    # 12 significant digits hide float noise like 0.30000000000000004
+    return b'%.12g' % value
+
+
+class ValueTransform:
+    """
+    Per-entity state transform, compiled once from the config into a single callable.
+
+    State is parsed to the number once, then steps are applied in order: invert, scale, offset, clamp (min/max), round.
+    Non-numeric states are passed as is. Commands from the HA are only inverted, other steps are not reversible.
+    """
+
+    def __init__(self, scale=None, offset=None, min=None, max=None, round=None, invert=False, units=None):
+        self.units = units
+        self._invert = invert
+        self._transform = self._compile(scale, offset, min, max, round, invert)
+
+    def __call__(self, payload: bytes) -> bytes:
+        return self._transform(payload)
+
+    def command(self, payload: bytes) -> bytes:
+        if self._invert:
+            return _INVERTED_PAYLOADS.get(payload, payload)
+        return payload
+
+    @staticmethod
+    def _compile(scale, offset, min_value, max_value, round_digits, invert):
+        if invert and scale is None and offset is None and min_value is None and max_value is None and round_digits is None:
+            # Binary states only, no need to parse
+            return lambda payload: _INVERTED_PAYLOADS.get(payload, payload)
+
+        steps = []
+        if invert:
+            steps.append(lambda value: 0.0 if value else 1.0)
+        if scale is not None:
+            steps.append(lambda value: value * scale)
+        if offset is not None:
+            steps.append(lambda value: value + offset)
+        if min_value is not None:
+            steps.append(lambda value: value if value > min_value else float(min_value))
+        if max_value is not None:
+            steps.append(lambda value: value if value < max_value else float(max_value))
+        if round_digits is not None:
+            steps.append(lambda value: float(round(value, round_digits)))
+
+        if len(steps) == 1:
+            step = steps[0]
+
+            def transform(payload):
+                try:
+                    value = float(payload)
+                except (TypeError, ValueError):
+                    return payload
+                return _format_number(step(value))
+        else:
+            def transform(payload):
+                try:
+                    value = float(payload)
+                except (TypeError, ValueError):
+                    return payload
+                for step in steps:
+                    value = step(value)
+                return _format_number(value)
+
+        return transform
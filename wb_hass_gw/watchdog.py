@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag: how late a sleep(interval) wakes up.
+    Lag above lag_threshold means that some callback blocked the loop
+    """
+
+    def __init__(self, interval, lag_threshold):
+        self._interval = interval
+        self._lag_threshold = lag_threshold
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + self._interval
+            await asyncio.sleep(self._interval)
+            lag = loop.time() - expected
+            if lag > self._lag_threshold:
+                logger.warning(f'Event loop lag: {lag * 1000:.1f} ms')
+
+
+class SamplingProfiler:
+    """
+    Samples the event loop thread stack from a background thread every `interval` seconds during `duration` seconds.
+    Result is written in the collapsed stack format ("frame;frame;frame count"),
+    which can be rendered with flamegraph.pl or https://www.speedscope.app
+    """
+
+    def __init__(self, duration, interval, output_dir):
+        self._duration = duration
+        self._interval = interval
+        self._output_dir = output_dir
+        self._thread = None
+        self._target_thread_id = threading.get_ident()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            logger.warning('Profiler is already running')
+            return
+        self._target_thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        logger.info(f'Profiling for {self._duration} sec')
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def _run(self):
+        samples = Counter()
+        deadline = time.monotonic() + self._duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is not None:
+                samples[self._collapse(frame)] += 1
+            del frame
+            time.sleep(self._interval)
+
+        path = os.path.join(self._output_dir, f'wb-hass-gw-{time.strftime("%Y%m%d-%H%M%S")}.folded')
+        try:
+            os.makedirs(self._output_dir, exist_ok=True)
+            with open(path, 'w') as f:
+                for stack, count in samples.most_common():
+                    f.write(f'{stack} {count}\n')
+        except OSError as e:
+            logger.error(f'Could not write profile: {e}')
+            return
+        logger.info(f'Profile with {sum(samples.values())} samples written to {path}')
@@ -4,6 +4,9 @@ import re
 
 from wb_hass_gw.base_connector import BaseConnector
 from wb_hass_gw.mappers import WirenControlType, WIREN_UNITS_DICT
+from wb_hass_gw.rate_limiter import ControlRateLimiter
+from wb_hass_gw.slow_callback import SlowCallbackTimer
+from wb_hass_gw.startup import StartupTimeline, PHASE_FIRST_META
 from wb_hass_gw.wirenboard_registry import WirenBoardDeviceRegistry, WirenDevice, WirenControl
 
 logger = logging.getLogger(__name__)
@@ -11,15 +14,27 @@ logger = logging.getLogger(__name__)
 
 class WirenConnector(BaseConnector):
     hass = None
+    sinks = ()
     _publish_delay_sec = 1  # Delay before publishing to ensure that we got all meta topics
     _subscribe_qos = 1
     _control_state_publish_qos = 1
     _control_state_publish_retain = False
 
-    def __init__(self, broker_host, broker_port, username, password, client_id, topic_prefix):
+    def __init__(self, broker_host, broker_port, username, password, client_id, topic_prefix,
+                 rate_limit_max_rate,
+                 rate_limit_quarantine_interval,
+                 rate_limit_release_after
+                 ):
         super().__init__(broker_host, broker_port, username, password, client_id)
 
         self._topic_prefix = topic_prefix
+        self._rate_limiter = ControlRateLimiter(
+            max_rate=rate_limit_max_rate,
+            quarantine_interval=rate_limit_quarantine_interval,
+            release_after=rate_limit_release_after
+        )
+        self._quarantine_flush_handles = {}
+        self._got_meta = False
 
         self._device_meta_topic_re = re.compile(self._topic_prefix + r"/devices/([^/]*)/meta/([^/]*)")
         self._control_meta_topic_re = re.compile(self._topic_prefix + r"/devices/([^/]*)/controls/([^/]*)/meta/([^/]*)")
@@ -42,6 +57,7 @@ class WirenConnector(BaseConnector):
             # publish availability separately. do not publish all device
             if control.apply_error(False if not meta_value else True):
                 self.hass.publish_availability(device, control)
+                WirenBoardDeviceRegistry().notify_control_change(device, control)
         else:
             has_changes = False
 
@@ -69,6 +85,7 @@ class WirenConnector(BaseConnector):
                 has_changes |= control.apply_max(int(meta_value) if meta_value else None)
             if has_changes:
                 self.hass.publish_config(device, control)
+                WirenBoardDeviceRegistry().notify_control_change(device, control)
 
     def _on_connect(self, client):
         client.subscribe(self._topic_prefix + '/devices/+/meta/+', qos=self._subscribe_qos)
@@ -77,19 +94,63 @@ class WirenConnector(BaseConnector):
 
     def _on_message(self, client, topic, payload, qos, properties):
         # print(f'RECV MSG: {topic}', payload)
+        # State topics are the most frequent ones, so match them first and skip the rest
+        control_state_topic_match = self._control_state_topic_re.match(topic)
+        if control_state_topic_match:
+            # State payload is kept as bytes, it is forwarded to the HA without decoding
+            self._on_control_state_change(control_state_topic_match.group(1), control_state_topic_match.group(2), payload)
+            return
         payload = payload.decode("utf-8")
+        if not self._got_meta:
+            self._got_meta = True
+            StartupTimeline().mark(PHASE_FIRST_META)
         device_topic_match = self._device_meta_topic_re.match(topic)
-        control_meta_topic_match = self._control_meta_topic_re.match(topic)
-        control_state_topic_match = self._control_state_topic_re.match(topic)
         if device_topic_match:
             self._on_device_meta_change(device_topic_match.group(1), device_topic_match.group(2), payload)
-        elif control_meta_topic_match:
+            return
+        control_meta_topic_match = self._control_meta_topic_re.match(topic)
+        if control_meta_topic_match:
             self._on_control_meta_change(control_meta_topic_match.group(1), control_meta_topic_match.group(2), control_meta_topic_match.group(3), payload)
-        elif control_state_topic_match:
-            device = WirenBoardDeviceRegistry().get_device(control_state_topic_match.group(1))
-            control = device.get_control(control_state_topic_match.group(2))
-            control.state = payload
-            self.hass.publish_state(device, control)
+
+    def _on_control_state_change(self, device_id, control_id, payload):
+        device = WirenBoardDeviceRegistry().get_device(device_id)
+        control = device.get_control(control_id)
+        control.apply_state(payload)
+        if self._rate_limiter.enabled and not self._rate_limiter.accept(device, control):
+            self._schedule_quarantine_flush(device, control)
+            return
+        self._publish_state(device, control)
+
+    def _publish_state(self, device: WirenDevice, control: WirenControl):
+        self.hass.publish_state(device, control)
+        for sink in self.sinks:
+            sink.publish_state(device, control)
+        WirenBoardDeviceRegistry().notify_control_change(device, control)
+
+    @property
+    def rate_limiter(self):
+        return self._rate_limiter
+
+    def _schedule_quarantine_flush(self, device: WirenDevice, control: WirenControl):
+        """
+        Forward only the latest state of the quarantined control once per quarantine interval.
+        The timer keeps running while the control is quarantined, so a control which went quiet is released too
+        """
+        key = (device.id, control.id)
+        if key in self._quarantine_flush_handles:
+            return
+
+        def flush():
+            with SlowCallbackTimer(f'WirenConnector.quarantine_flush({device.id}/{control.id})'):
+                if self._rate_limiter.take_pending(device, control):
+                    self._publish_state(device, control)
+                if self._rate_limiter.check_quarantine(device, control):
+                    self._quarantine_flush_handles[key] = loop.call_later(self._rate_limiter.quarantine_interval, flush)
+                else:
+                    del self._quarantine_flush_handles[key]
+
+        loop = asyncio.get_event_loop()
+        self._quarantine_flush_handles[key] = loop.call_later(self._rate_limiter.quarantine_interval, flush)
 
     def set_control_state(self, device: WirenDevice, control: WirenControl, payload):
         target_topic = f"{self._topic_prefix}/devices/{device.id}/controls/{control.id}/on"
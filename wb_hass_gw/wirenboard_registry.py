@@ -1,4 +1,5 @@
 import logging
+import time
 
 from wb_hass_gw.mappers import WirenControlType
 
@@ -11,7 +12,10 @@ class WirenControl:
     error = None
     units = None
     max = None
-    state = None
+    last_update = None
+    transform = None  # ValueTransform attached by the HA connector, False if entity has no transform
+    _raw_state = None
+    _state = None
 
     def __init__(self, control_id):
         self.id = control_id
@@ -20,6 +24,29 @@ class WirenControl:
     def debug_id(self):
         return self.id.lower().replace(" ", "_").replace("-", "_")
 
+    @property
+    def raw_state(self) -> bytes:
+        """
+        State payload as it was received from the Wiren Board
+        """
+        return self._raw_state
+
+    @property
+    def state(self) -> str:
+        # Decode lazily, payload is forwarded as bytes when no transformation is needed
+        if self._state is None and self._raw_state is not None:
+            self._state = self._raw_state.decode('utf-8')
+        return self._state
+
+    def apply_state(self, state):
+        if isinstance(state, str):
+            self._state = state
+            self._raw_state = state.encode('utf-8')
+        else:
+            self._state = None
+            self._raw_state = state
+        self.last_update = time.time()
+
     def apply_type(self, t):
         if self.type == t:
             return False
@@ -77,7 +104,7 @@ class WirenDevice:
     def get_control(self, control_id) -> WirenControl:
         if control_id not in self._controls.keys():
             self._controls[control_id] = WirenControl(control_id)
-            logger.debug(f'{self}: new control: {control_id}')
+            logger.debug('%s: new control: %s', self, control_id)
         return self._controls[control_id]
 
     def __str__(self) -> str:
@@ -86,6 +113,7 @@ class WirenDevice:
 
 class WirenBoardDeviceRegistry:
     _devices = {}
+    _listeners = []
 
     local_device_id = 'wirenboard'
     local_device_name = 'Wirenboard'
@@ -103,9 +131,22 @@ class WirenBoardDeviceRegistry:
     def get_device(self, device_id) -> WirenDevice:
         if device_id not in self._devices.keys():
             self._devices[device_id] = WirenDevice(device_id)
-            logger.debug(f'New device: {device_id}')
+            logger.debug('New device: %s', device_id)
 
         return self._devices[device_id]
 
     def is_local_device(self, device):
         return device.id in self._local_devices
+
+    def add_listener(self, listener):
+        """
+        Register callback(device, control) which is called on every control state or meta change
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def notify_control_change(self, device: WirenDevice, control: WirenControl):
+        for listener in self._listeners:
+            listener(device, control)